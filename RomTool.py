@@ -2,11 +2,24 @@ import os
 import subprocess
 import threading
 import json
+import hashlib
+import struct
+import zipfile
 import shlex
 import re
-from datetime import datetime
+import gzip
+import time
+import uuid
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from typing import Optional, Tuple, List, Dict, Any
 import customtkinter as ctk
+try:
+    import orjson  # optional fast path for log records
+except ImportError:
+    orjson = None
 
 # -------------------------
 # CONFIG
@@ -23,11 +36,72 @@ SAFE_COMMANDS = (
 SAFE_PREFIXES = (
     "fastboot getvar","fastboot oem device-info","adb shell getprop",
 )
+TRANSCRIPT_DIR = os.path.join("Logs", "Transcripts")
+TRANSPORT_MODE = os.environ.get("ROMTOOL_TRANSPORT", "live")  # live | record | replay
+TRANSPORT_TRANSCRIPT = os.environ.get("ROMTOOL_TRANSCRIPT", "")  # replay source / record target
+TRANSPORT_REPLAY_SPEED = os.environ.get("ROMTOOL_REPLAY_SPEED", "1.0")  # 0 = no delays
+CAPTURE_DIR = os.path.join("Logs", "Captures")
+CAPTURE_SEGMENT_BYTES = 1 * 1024 * 1024  # uncompressed bytes per ring segment
+CAPTURE_SEGMENTS = 8
+CAPTURE_MAX_SECONDS = 600
+CAPTURE_POST_BOOT_SECONDS = 30
+CAPTURE_MIRROR_PER_SEC = 5
+CAPTURE_MIRROR_RE = re.compile(r"FATAL|Fatal signal|beginning of crash|Kernel panic|ANR in|sys\.boot_completed|BOOT_COMPLETED|Boot is finished")
+CAPTURE_BOOT_RE = re.compile(r"sys\.boot_completed|BOOT_COMPLETED|Boot is finished")
+ZIP_VERIFY_CACHE_PATH = os.path.join("Logs", "zip_verify_cache.json")
+ZIP_VERIFY_WORKERS = max(1, min(4, os.cpu_count() or 1))
+ZIP_VERIFY_CHUNK = 1024 * 1024
+LP_GEOMETRY_MAGIC = 0x616C4467
+LP_HEADER_MAGIC = 0x414C5030
+LP_GEOMETRY_SIZE = 4096
+LP_SECTOR_SIZE = 512
+SPARSE_HEADER_MAGIC = 0xED26FF3A
+FASTBOOTD_WAIT_SECONDS = 90
 
 # -------------------------
 # LOGGING
 # -------------------------
 
+SESSION_ID = uuid.uuid4().hex[:12]
+COMMAND_IDS = itertools.count(1)
+LOG_CONTEXT = threading.local()
+LOG_LOCK = threading.RLock()
+LOG_INDEX_KEYS = ("cmd", "flash_session", "serial")
+LOG_INDEX: Dict[str, Dict[str, List[int]]] = {k: {} for k in LOG_INDEX_KEYS}
+def new_command_id() -> str:
+    return f"c{next(COMMAND_IDS)}"
+def current_log_fields() -> Dict[str, Any]:
+    return dict(getattr(LOG_CONTEXT, "fields", {}))
+@contextmanager
+def log_context(**fields: Any):
+    """Tag every log record written by this thread inside the block with 'fields' (cmd, serial, ...)."""
+    previous = getattr(LOG_CONTEXT, "fields", {})
+    LOG_CONTEXT.fields = {**previous, **{k: v for k, v in fields.items() if v is not None}}
+    try:
+        yield LOG_CONTEXT.fields
+    finally:
+        LOG_CONTEXT.fields = previous
+def in_log_context(func, **fields: Any):
+    """Wrap a thread target so everything it logs carries 'fields'."""
+    def runner(*args, **kwargs):
+        with log_context(**fields):
+            return func(*args, **kwargs)
+    return runner
+def log_stamp() -> Dict[str, Any]:
+    return {"ts": datetime.now(timezone.utc).isoformat(timespec="microseconds"), "mono_ns": time.monotonic_ns()}
+def _dump_log_record(payload: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload)
+        except Exception:
+            pass
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+def _load_log_record(raw) -> Dict[str, Any]:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+def reset_log_index() -> None:
+    with LOG_LOCK:
+        for key in LOG_INDEX_KEYS:
+            LOG_INDEX[key].clear()
 def ensure_logs_dir():
     os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
 def rotate_logs_if_needed():
@@ -47,25 +121,68 @@ def rotate_logs_if_needed():
                         os.replace(src, dst)
             try:
                 os.replace(LOG_PATH, f"{LOG_PATH}.1")
+                reset_log_index()
             except Exception:
                 pass
     except Exception:
         pass
-def write_log_entry(level: str, message: str) -> None:
-    """Append a structured JSON line {timestamp, level, message} to the log file."""
-    ensure_logs_dir()
-    rotate_logs_if_needed()
+def write_log_entry(level: str, message: str, **fields: Any) -> None:
+    """Append a structured JSON line to the log file.
+
+    Records carry local and UTC time, a monotonic ns stamp and the session id, plus the
+    thread's log context and any extra fields (cmd, serial, flash_session, duration_ns...).
+    """
     payload = {
         "timestamp": datetime.now().strftime("%d-%m-%Y %I:%M:%S %p"),
+        **log_stamp(),
         "level": (level or "INFO").upper(),
         "message": str(message),
+        "session": SESSION_ID,
     }
+    payload.update(current_log_fields())
+    payload.update({k: v for k, v in fields.items() if v is not None})
     try:
-        line = json.dumps(payload, ensure_ascii=False)
+        line = _dump_log_record(payload)
     except Exception:
-        line = f"[{payload['timestamp']}] {payload['level']}: {payload['message']}"
-    with open(LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+        line = f"[{payload['timestamp']}] {payload['level']}: {payload['message']}".encode("utf-8")
+    with LOG_LOCK:
+        ensure_logs_dir()
+        rotate_logs_if_needed()
+        with open(LOG_PATH, "ab") as f:
+            offset = f.tell()
+            f.write(line + b"\n")
+        for key in LOG_INDEX_KEYS:
+            value = payload.get(key)
+            if value is not None:
+                LOG_INDEX[key].setdefault(str(value), []).append(offset)
+def lookup_log_records(key: str, value: str) -> List[Dict[str, Any]]:
+    """Return records for a cmd, flash_session or serial using the offset index.
+
+    The index lives in memory: it covers only records written by the current session and
+    is cleared when the log rotates or is cleared.
+    """
+    records = []
+    with LOG_LOCK:
+        offsets = list(LOG_INDEX.get(key, {}).get(str(value), []))
+        if not offsets or not os.path.isfile(LOG_PATH):
+            return records
+        with open(LOG_PATH, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                try:
+                    records.append(_load_log_record(f.readline()))
+                except Exception:
+                    continue
+    return records
+def operation_latency_ns(records: List[Dict[str, Any]]) -> Optional[int]:
+    """Time from the earliest start to the last record of a group, honouring duration_ns fields.
+
+    mono_ns is only comparable within one session, so pass records from lookup_log_records.
+    """
+    spans = [(r["mono_ns"] - r.get("duration_ns", 0), r["mono_ns"]) for r in records if "mono_ns" in r]
+    if not spans:
+        return None
+    return max(end for _, end in spans) - min(start for start, _ in spans)
 
 # -------------------------
 # CONSOLE (CTkTextbox)
@@ -93,8 +210,10 @@ def init_console(parent) -> ctk.CTkTextbox:
         txt.tag_config(tag, foreground=color)
 
     return txt
-def append_console(text: str, level="INFO", timestamp=True):
+def append_console(text: str, level="INFO", timestamp=True, **fields: Any):
     """Append new line to console with colored tag + log file entry."""
+    # stamp and context are taken on the calling thread, not when Tk gets to the line
+    log_fields = {**current_log_fields(), **log_stamp(), **fields}
     raw_message = str(text)
     ui_text = raw_message
     if timestamp:
@@ -102,14 +221,14 @@ def append_console(text: str, level="INFO", timestamp=True):
         ui_text = f"[{now}] {raw_message}"
     normalized_level = (level or "INFO").upper()
     tag_name = f"LEVEL_{normalized_level}"
-    app.after(0, _append_console_ui, ui_text, raw_message, normalized_level, tag_name)
-def _append_console_ui(ui_text: str, raw_message: str, level: str, tag_name: str):
+    app.after(0, _append_console_ui, ui_text, raw_message, normalized_level, tag_name, log_fields)
+def _append_console_ui(ui_text: str, raw_message: str, level: str, tag_name: str, log_fields: Dict[str, Any]):
     # store in buffer for filtering
     CONSOLE_BUFFER.append((ui_text, level))
     if len(CONSOLE_BUFFER) > CONSOLE_BUFFER_MAX:
         del CONSOLE_BUFFER[: len(CONSOLE_BUFFER) - CONSOLE_BUFFER_MAX]
     _refresh_console_view()
-    write_log_entry(level, raw_message)
+    write_log_entry(level, raw_message, **log_fields)
 def replace_last_console_line(new_text: str, level: str = "INFO"):
     """Replace last line in console with styled text."""
     tag_name = f"LEVEL_{level.upper()}"
@@ -211,16 +330,37 @@ def read_log_text() -> str:
                     ts = obj.get("timestamp", "?")
                     lvl = obj.get("level", "INFO")
                     msg = obj.get("message", "")
-                    lines.append(f"[{ts}] [{lvl}] {msg}")
+                    cmd = f" [{obj['cmd']}]" if obj.get("cmd") else ""
+                    took = f" ({obj['duration_ns'] / 1e6:.1f} ms)" if obj.get("duration_ns") is not None else ""
+                    lines.append(f"[{ts}] [{lvl}]{cmd} {msg}{took}")
                 except Exception:
                     lines.append(raw)
         return "\n".join(lines)
     except Exception as e:
         return f"Failed to read log file: {e}"
+def summarize_log_operations() -> str:
+    """List this session's flash sessions and commands with record counts and latency."""
+    lines = []
+    for key, title in (("flash_session", "Flash sessions"), ("cmd", "Commands")):
+        with LOG_LOCK:
+            values = list(LOG_INDEX[key])
+        if not values:
+            continue
+        lines.append(f"{title}:")
+        for value in values:
+            records = lookup_log_records(key, value)
+            latency = operation_latency_ns(records)
+            took = f"{latency / 1e9:.3f} s" if latency is not None else "?"
+            first = records[0].get("message", "") if records else ""
+            lines.append(f"  [{value}] {len(records):>5} records {took:>12}  {first[:70]}")
+        lines.append("")
+    if not lines:
+        return "No commands logged in this session yet."
+    return "\n".join([f"Session {SESSION_ID} (older sessions are in the full log)", ""] + lines)
 def open_logs_modal():
     win = ctk.CTkToplevel(app)
     win.title("Logs")
-    win.geometry("720x460")
+    win.geometry("860x460")
     win.grab_set()
     container = ctk.CTkFrame(win, corner_radius=12)
     container.pack(fill="both", expand=True, padx=10, pady=10)
@@ -234,6 +374,11 @@ def open_logs_modal():
         txt.delete("1.0", "end")
         txt.insert("1.0", read_log_text())
         txt.configure(state="disabled")
+    def do_operations():
+        txt.configure(state="normal")
+        txt.delete("1.0", "end")
+        txt.insert("1.0", summarize_log_operations())
+        txt.configure(state="disabled")
     def do_open_folder():
         try:
             os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
@@ -254,13 +399,16 @@ def open_logs_modal():
             show_dialog("error", "Export Logs", str(e))
     def do_clear():
         try:
-            if os.path.isfile(LOG_PATH):
-                os.remove(LOG_PATH)
+            with LOG_LOCK:
+                if os.path.isfile(LOG_PATH):
+                    os.remove(LOG_PATH)
+                reset_log_index()
             do_refresh()
             append_console("[INFO] Logs cleared.")
         except Exception as e:
             show_dialog("error", "Clear Logs", str(e))
     create_button(btns, "Refresh", do_refresh, variant="secondary").pack(side="left", padx=6)
+    create_button(btns, "Operations", do_operations, variant="secondary").pack(side="left", padx=6)
     create_button(btns, "Open Folder", do_open_folder, variant="secondary").pack(side="left", padx=6)
     create_button(btns, "Export", do_export, variant="secondary").pack(side="left", padx=6)
     create_button(btns, "Clear", do_clear, variant="danger").pack(side="left", padx=6)
@@ -273,15 +421,149 @@ def open_logs_modal():
 # SUBPROCESS
 # -------------------------
 
+TRANSPORT_LOCK = threading.Lock()
+TRANSPORT: Dict[str, Any] = {"mode": "live", "path": None, "speed": 1.0, "replay": {}}
+def set_transport(mode: str, transcript_path: Optional[str] = None, speed: float = 1.0) -> None:
+    """Select the live, record or replay command transport for all adb/fastboot calls."""
+    mode = (mode or "live").lower()
+    replay: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    if mode == "record":
+        transcript_path = transcript_path or os.path.join(
+            TRANSCRIPT_DIR, f"session-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl")
+        os.makedirs(os.path.dirname(transcript_path) or ".", exist_ok=True)
+    elif mode == "replay":
+        if not transcript_path or not os.path.isfile(transcript_path):
+            raise ValueError(f"Transcript not found: {transcript_path or '(not set)'}")
+        replay = load_transcript(transcript_path)
+    elif mode != "live":
+        raise ValueError(f"Unknown transport mode: {mode}")
+    with TRANSPORT_LOCK:
+        TRANSPORT.update(mode=mode, path=transcript_path, speed=max(0.0, speed), replay=replay)
+def parse_replay_speed(text: str) -> float:
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid replay speed: {text!r} (use a number, 0 = no delays)")
+# adb/fastboot verb -> offsets (from the verb) of its host-file arguments
+TRANSCRIPT_HOST_FILE_ARGS = {"sideload": (1,), "flash": (2,), "boot": (1,), "update": (1,), "push": (1,), "install": (1,)}
+def transcript_key(argv: List[str]) -> Tuple[str, ...]:
+    """Replay lookup key: host-file arguments of flash/sideload/push... match on basename so host
+    paths need not be identical; every other argument (device paths, shell commands) is kept as is."""
+    key = list(argv)
+    verb_at = 1
+    while verb_at < len(argv) and argv[verb_at].startswith("-"):
+        verb_at += 2 if argv[verb_at] in ("-s", "-t", "-H", "-P") else 1
+    if verb_at < len(argv):
+        for offset in TRANSCRIPT_HOST_FILE_ARGS.get(argv[verb_at], ()):
+            i = verb_at + offset
+            if i < len(argv) and not argv[i].startswith("-"):
+                key[i] = re.split(r"[\\/]", argv[i])[-1]
+    return tuple(key)
+def load_transcript(path: str) -> Dict[Tuple[str, ...], List[Dict[str, Any]]]:
+    """Read a transcript into {transcript_key(argv): [records in recorded order]}."""
+    records: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for raw in f:
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                rec = json.loads(raw)
+            except Exception:
+                continue
+            records.setdefault(transcript_key(rec.get("argv", [])), []).append(rec)
+    return records
+def _record_invocation(argv: List[str], chunks: List[Tuple[float, str]], code: int, started: float) -> None:
+    """Append one {argv, chunks: [[offset_s, text]], code, duration} line to the transcript."""
+    rec = {
+        "argv": argv,
+        "chunks": [[round(offset, 3), text] for offset, text in chunks],
+        "code": code,
+        "duration": round(time.monotonic() - started, 3),
+    }
+    line = json.dumps(rec, ensure_ascii=False, separators=(",", ":"))
+    with TRANSPORT_LOCK:
+        with open(TRANSPORT["path"], "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+def _replay_invocation(argv: List[str], on_chunk, stop: Optional[threading.Event] = None) -> int:
+    """Feed recorded chunks for argv to on_chunk at the configured speed and return the recorded exit code."""
+    with TRANSPORT_LOCK:
+        queue = TRANSPORT["replay"].get(transcript_key(argv))
+        # the last recording of a command keeps answering once its queue runs dry
+        rec = (queue.pop(0) if len(queue) > 1 else queue[0]) if queue else None
+        speed = TRANSPORT["speed"]
+    if rec is None:
+        on_chunk(f"[ERROR] No recorded output for: {shlex.join(argv)}")
+        return 1
+    elapsed = 0.0
+    for offset, text in rec.get("chunks", []):
+        if speed > 0 and offset > elapsed:
+            if stop is not None:
+                stop.wait((offset - elapsed) / speed)
+            else:
+                time.sleep((offset - elapsed) / speed)
+            elapsed = offset
+        if stop is not None and stop.is_set():
+            break
+        on_chunk(text)
+    return int(rec.get("code", 1))
 def run_subprocess(cmd: str, capture_output: bool = True) -> Tuple[int, str]:
     try:
-        proc = subprocess.run(shlex.split(cmd), capture_output=capture_output, text=True, timeout=30)
-        out = (proc.stdout or "") + (proc.stderr or "")
-        return proc.returncode, out.strip()
+        argv = shlex.split(cmd)
+    except ValueError as e:
+        return 1, f"[ERROR] Exception: {e}"
+    mode = TRANSPORT["mode"]
+    if mode == "replay":
+        parts: List[str] = []
+        code = _replay_invocation(argv, parts.append)
+        return code, "".join(parts).strip()
+    started = time.monotonic()
+    try:
+        proc = subprocess.run(argv, capture_output=capture_output, text=True, timeout=30)
+        code, out = proc.returncode, (proc.stdout or "") + (proc.stderr or "")
     except subprocess.TimeoutExpired:
-        return 1, "[ERROR] Command timed out."
+        code, out = 1, "[ERROR] Command timed out."
     except Exception as e:
-        return 1, f"[ERROR] Exception: {e}"
+        code, out = 1, f"[ERROR] Exception: {e}"
+    if mode == "record":
+        _record_invocation(argv, [(time.monotonic() - started, out)], code, started)
+    return code, out.strip()
+def stream_command(argv: List[str], on_line, stop: Optional[threading.Event] = None, record: bool = True) -> int:
+    """Run argv through the active transport, passing each output line to on_line; return the exit code.
+
+    Setting 'stop' terminates the command early. With record=False the call is kept out of the transcript.
+    """
+    mode = TRANSPORT["mode"]
+    if mode == "replay":
+        return _replay_invocation(argv, on_line, stop)
+    recording = mode == "record" and record
+    started = time.monotonic()
+    chunks: List[Tuple[float, str]] = []
+    try:
+        process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    except Exception as e:
+        msg = f"[ERROR] Exception: {e}"
+        chunks.append((0.0, msg))
+        on_line(msg)
+        code = 1
+    else:
+        if stop is not None:
+            def terminate_on_stop():
+                while not stop.wait(0.5):
+                    if process.poll() is not None:
+                        return
+                if process.poll() is None:
+                    process.terminate()
+            threading.Thread(target=terminate_on_stop, daemon=True).start()
+        for line in iter(process.stdout.readline, ''):
+            if recording:
+                chunks.append((time.monotonic() - started, line))
+            on_line(line)
+        process.wait()
+        code = process.returncode
+    if recording:
+        _record_invocation(argv, chunks, code, started)
+    return code
 
 # -------------------------
 # CUSTOM DIALOGS
@@ -338,11 +620,14 @@ def run_command_thread(cmd: str, require_confirmation=True):
                 append_console("[INFO] Command aborted by user.")
                 return
         append_console(cmd, "CMD")
+        started = time.monotonic_ns()
         code, out = run_subprocess(cmd)
+        duration_ns = time.monotonic_ns() - started
         if out:
             append_console(out, "INFO")
-        append_console(f"Exit code: {code}", "INFO")
-    threading.Thread(target=worker, daemon=True).start()
+        append_console(f"Exit code: {code}", "INFO", exit_code=code, duration_ns=duration_ns)
+    threading.Thread(target=in_log_context(worker, cmd=new_command_id(), serial=LAST_DEVICE["serial"],
+                                           flash_session=FLASH_SESSION["id"]), daemon=True).start()
 def is_harmless(cmd: str) -> bool:
     normalized = " ".join(cmd.strip().lower().replace('"','').split())
     if normalized in SAFE_COMMANDS:
@@ -369,8 +654,13 @@ def parse_adb_output(adb_out: str) -> List[Tuple[str, str]]:
     lines = [l.strip() for l in adb_out.splitlines()
              if l.strip() and not l.startswith("List of devices attached")]
     return [(l.split()[0], l.split()[1]) for l in lines if len(l.split()) >= 2]
+LAST_DEVICE: Dict[str, Optional[str]] = {"mode": "NONE", "serial": None}
 def get_device_state() -> Tuple[str, Optional[str]]:
     """Check device state and return (mode, serial)."""
+    mode, serial = _probe_device_state()
+    LAST_DEVICE.update(mode=mode, serial=serial)
+    return mode, serial
+def _probe_device_state() -> Tuple[str, Optional[str]]:
     code_fb, out_fb = run_subprocess("fastboot devices")
     if code_fb == 0 and out_fb:
         return "FASTBOOT", out_fb.split()[0]
@@ -390,6 +680,137 @@ def get_device_state() -> Tuple[str, Optional[str]]:
                 return "ADB", serial
     return "NONE", None
 
+# -------------------------
+# DEVICE LOG CAPTURE
+# -------------------------
+
+CAPTURES: Dict[str, Dict[str, Any]] = {}
+CAPTURES_LOCK = threading.Lock()
+FLASH_SESSION: Dict[str, Optional[str]] = {"id": None, "label": None}
+def mark_flash_session(label: str) -> str:
+    """Start a flash session; the next reboot captures device logs under its id."""
+    session_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    FLASH_SESSION.update(id=session_id, label=label)
+    if hasattr(LOG_CONTEXT, "fields"):
+        LOG_CONTEXT.fields["flash_session"] = session_id
+    write_log_entry("INFO", f"Flash session started: {label}", flash_session=session_id)
+    return session_id
+def _ring_write(cap: Dict[str, Any], text: str) -> None:
+    """Write to the current gzip segment, rolling over and dropping the oldest segment when full."""
+    with cap["lock"]:
+        if cap["closed"]:
+            return
+        if cap["fh"] is None or cap["written"] >= CAPTURE_SEGMENT_BYTES:
+            if cap["fh"] is not None:
+                cap["fh"].close()
+            cap["seq"] += 1
+            oldest = os.path.join(cap["folder"], f"seg-{cap['seq'] - CAPTURE_SEGMENTS:06d}.log.gz")
+            if os.path.exists(oldest):
+                try:
+                    os.remove(oldest)
+                except Exception:
+                    pass
+            cap["fh"] = gzip.open(os.path.join(cap["folder"], f"seg-{cap['seq']:06d}.log.gz"), "wt", encoding="utf-8")
+            cap["written"] = 0
+        cap["fh"].write(text)
+        cap["written"] += len(text)
+def _ring_close(cap: Dict[str, Any]) -> None:
+    with cap["lock"]:
+        cap["closed"] = True
+        if cap["fh"] is not None:
+            try:
+                cap["fh"].close()
+            except Exception:
+                pass
+            cap["fh"] = None
+def _flush_suppressed(cap: Dict[str, Any]) -> None:
+    if cap["suppressed"]:
+        append_console(f"[WARNING] {cap['serial']}: {cap['suppressed']} capture lines not shown", "WARNING")
+        cap["suppressed"] = 0
+def _capture_line(cap: Dict[str, Any], line: str) -> None:
+    """Store a captured line and mirror crash/boot lines to the console at a bounded rate."""
+    _ring_write(cap, line if line.endswith("\n") else line + "\n")
+    cap["lines"] += 1
+    text = line.rstrip()
+    if not CAPTURE_MIRROR_RE.search(text):
+        return
+    booted = bool(CAPTURE_BOOT_RE.search(text))
+    if booted and not cap["booted"]:
+        cap["booted"] = True
+        timer = threading.Timer(CAPTURE_POST_BOOT_SECONDS, cap["stop"].set)
+        timer.daemon = True
+        timer.start()
+    window = int(time.monotonic())
+    if window != cap["window"]:
+        _flush_suppressed(cap)
+        cap["window"], cap["mirrored"] = window, 0
+    if cap["mirrored"] >= CAPTURE_MIRROR_PER_SEC and not booted:
+        cap["suppressed"] += 1
+        return
+    cap["mirrored"] += 1
+    append_console(f"[{cap['serial']}] {text}", "SUCCESS" if booted else "ERROR")
+def start_device_capture(serial: str, source: str = "logcat", session_id: Optional[str] = None) -> Optional[str]:
+    """Stream logcat (or dmesg in recovery) for 'serial' into a compressed ring buffer; return its folder.
+
+    A capture already running for 'serial' (e.g. dmesg from an earlier reboot to recovery) is stopped
+    and replaced, since the device is about to leave that mode.
+    """
+    if TRANSPORT["mode"] == "replay":
+        append_console(f"[INFO] Skipping {source} capture for {serial} during replay.", "INFO")
+        return None
+    stamp = session_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+    folder = os.path.join(CAPTURE_DIR, f"{stamp}-{re.sub(r'[^A-Za-z0-9_.-]', '_', serial)}-{source}")
+    with CAPTURES_LOCK:
+        previous = CAPTURES.get(serial)
+        if previous is not None:
+            append_console(f"[INFO] Stopping {previous['source']} capture for {serial}; starting {source}.", "INFO")
+            previous["stop"].set()
+        os.makedirs(folder, exist_ok=True)
+        cap = {
+            "serial": serial, "source": source, "folder": folder, "session": session_id,
+            "stop": threading.Event(), "lock": threading.Lock(), "closed": False,
+            "fh": None, "seq": -1, "written": 0, "lines": 0, "booted": False,
+            "window": 0, "mirrored": 0, "suppressed": 0,
+        }
+        CAPTURES[serial] = cap
+    if source == "dmesg":
+        argv = ["adb", "-s", serial, "wait-for-recovery", "shell", "dmesg", "-w"]
+    else:
+        argv = ["adb", "-s", serial, "wait-for-device", "logcat", "-v", "threadtime"]
+    def worker():
+        started = time.monotonic_ns()
+        append_console(f"[INFO] Capturing {source} from {serial} -> {folder}", "INFO")
+        timer = threading.Timer(CAPTURE_MAX_SECONDS, cap["stop"].set)
+        timer.daemon = True
+        timer.start()
+        try:
+            # adb drops on every reboot; reattach until stopped so a bootloop's attempts share one ring
+            # capture streams stay out of transcripts: they are long-running and bounded by the ring instead
+            while not cap["stop"].is_set():
+                stream_command(argv, lambda line: _capture_line(cap, line), stop=cap["stop"], record=False)
+                if not cap["stop"].is_set():
+                    _ring_write(cap, f"--- {source} stream from {serial} ended at {datetime.now().strftime('%H:%M:%S')}; reattaching ---\n")
+                    cap["stop"].wait(1)
+        finally:
+            timer.cancel()
+            _ring_close(cap)
+            with CAPTURES_LOCK:
+                if CAPTURES.get(serial) is cap:
+                    del CAPTURES[serial]
+        _flush_suppressed(cap)
+        write_log_entry("INFO", f"{source} capture saved: {folder} ({cap['lines']} lines)",
+                        capture=folder, duration_ns=time.monotonic_ns() - started)
+        append_console(f"[INFO] {source} capture for {serial} saved ({cap['lines']} lines)", "INFO")
+    threading.Thread(target=in_log_context(worker, cmd=new_command_id(), serial=serial, flash_session=session_id),
+                     daemon=True).start()
+    return folder
+def stop_all_captures() -> None:
+    with CAPTURES_LOCK:
+        caps = list(CAPTURES.values())
+    for cap in caps:
+        cap["stop"].set()
+        _ring_close(cap)
+
 # -------------------------
 # DEVICE FOLDER UTILS
 # -------------------------
@@ -413,42 +834,486 @@ def find_boot_path(device_folder: str) -> Optional[str]:
     boot_p = os.path.join(recovery, "Boot")
     return boot_p if os.path.isdir(boot_p) else recovery
 
+# -------------------------
+# ZIP VERIFICATION
+# -------------------------
+
+ZIP_VERIFY_LOCK = threading.Lock()
+ZIP_VERIFY_CACHE: Dict[str, Any] = {}
+def _load_zip_cache() -> Dict[str, Any]:
+    if not ZIP_VERIFY_CACHE and os.path.isfile(ZIP_VERIFY_CACHE_PATH):
+        try:
+            with open(ZIP_VERIFY_CACHE_PATH, "r", encoding="utf-8") as f:
+                ZIP_VERIFY_CACHE.update(json.load(f))
+        except Exception:
+            pass
+    return ZIP_VERIFY_CACHE
+def _save_zip_cache() -> None:
+    try:
+        ensure_logs_dir()
+        with open(ZIP_VERIFY_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(ZIP_VERIFY_CACHE, f, ensure_ascii=False)
+    except Exception:
+        pass
+def check_zip_footer(path: str, size: int) -> Tuple[bool, str, bool]:
+    """Check the end-of-central-directory record and the OTA whole-file signature footer.
+
+    Returns (ok, message, signed). A missing signature footer is not an error.
+    """
+    tail_len = min(size, 22 + 0xFFFF)
+    if tail_len < 22:
+        return False, "File too small to be a ZIP.", False
+    with open(path, "rb") as f:
+        f.seek(size - tail_len)
+        tail = f.read(tail_len)
+    eocd = tail.rfind(b"PK\x05\x06")
+    if eocd < 0 or eocd + 22 > len(tail):
+        return False, "End-of-central-directory record not found (truncated download?).", False
+    comment_len = struct.unpack("<H", tail[eocd + 20:eocd + 22])[0]
+    if eocd + 22 + comment_len != len(tail):
+        return False, "End-of-central-directory record does not end the file (truncated or padded).", False
+    # signed OTA footer: signature_start (u16), 0xFFFF, comment_size (u16) in the last 6 bytes
+    sig_start, marker, footer_comment = struct.unpack("<HHH", tail[-6:])
+    signed = marker == 0xFFFF and footer_comment == comment_len and 6 <= sig_start <= comment_len
+    return True, "", signed
+def _verify_zip_uncached(path: str, size: int, progress=None) -> Tuple[bool, str, bool]:
+    """Return (ok, message, cacheable); I/O failures are not cacheable since a retry may succeed."""
+    try:
+        ok, message, signed = check_zip_footer(path, size)
+    except OSError as e:
+        return False, f"Cannot read file: {e}", False
+    if not ok:
+        return False, message, True
+    try:
+        zf = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        return False, f"Unreadable ZIP: {e}", True
+    except OSError as e:
+        return False, f"Cannot read file: {e}", False
+    with zf:
+        # largest entries first so the pool finishes together
+        infos = sorted((i for i in zf.infolist() if not i.is_dir()), key=lambda i: i.compress_size, reverse=True)
+        total = sum(i.file_size for i in infos) or 1
+        state = {"bytes": 0, "percent": -1}
+        lock = threading.Lock()
+        failed = threading.Event()
+        def check(info: zipfile.ZipInfo) -> Optional[Tuple[str, str]]:
+            """Return None when the CRC matches, else (kind, detail) with kind corrupt/io/unverifiable."""
+            if failed.is_set():
+                return None
+            try:
+                # reading to EOF makes ZipExtFile compare the CRC32
+                with zf.open(info) as fh:
+                    while not failed.is_set():
+                        chunk = fh.read(ZIP_VERIFY_CHUNK)
+                        if not chunk:
+                            break
+                        with lock:
+                            state["bytes"] += len(chunk)
+                            percent = state["bytes"] * 100 // total
+                            changed = percent != state["percent"]
+                            state["percent"] = percent
+                        if changed and progress:
+                            progress(percent)
+            except (NotImplementedError, RuntimeError) as e:
+                # unsupported compression or encrypted entry: says nothing about corruption
+                return "unverifiable", f"{info.filename}: {e}"
+            except OSError as e:
+                failed.set()
+                return "io", f"{info.filename}: {e}"
+            except Exception as e:
+                failed.set()
+                return "corrupt", f"{info.filename}: {e}"
+            return None
+        with ThreadPoolExecutor(max_workers=ZIP_VERIFY_WORKERS) as pool:
+            results = [r for r in pool.map(check, infos) if r]
+    io_errors = [detail for kind, detail in results if kind == "io"]
+    if io_errors:
+        return False, f"Cannot read file: {io_errors[0]}", False
+    corrupt = [detail for kind, detail in results if kind == "corrupt"]
+    if corrupt:
+        return False, f"Corrupt entry {corrupt[0]}", True
+    unverifiable = [detail for kind, detail in results if kind == "unverifiable"]
+    message = f"{len(infos) - len(unverifiable)} entries, CRC32 OK"
+    if unverifiable:
+        message += f"; cannot verify {len(unverifiable)} entr{'y' if len(unverifiable) == 1 else 'ies'} ({unverifiable[0]})"
+    if not signed:
+        message += "; no whole-file signature footer (unsigned package)"
+    return True, message, True
+def verify_zip(path: str, progress=None) -> Tuple[bool, str]:
+    """Verify a ROM zip before sideload; content results are cached per (path, size, mtime)."""
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        return False, f"Cannot read file: {e}"
+    key = os.path.abspath(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    with ZIP_VERIFY_LOCK:
+        cached = _load_zip_cache().get(key)
+    if cached and cached.get("stamp") == stamp:
+        return cached["ok"], f"{cached['message']} (cached)"
+    ok, message, cacheable = _verify_zip_uncached(path, st.st_size, progress)
+    if cacheable:
+        with ZIP_VERIFY_LOCK:
+            ZIP_VERIFY_CACHE[key] = {"stamp": stamp, "ok": ok, "message": message}
+            _save_zip_cache()
+    return ok, message
+
+# -------------------------
+# SUPER PARTITION METADATA
+# -------------------------
+
+def _lp_name(raw: bytes) -> str:
+    return raw.split(b"\0", 1)[0].decode("ascii", "replace")
+def parse_lp_metadata(path: str) -> Dict[str, Any]:
+    """Parse the LP (dynamic partition) metadata of super_empty.img or a raw super image.
+
+    Raises ValueError if the image holds no valid metadata.
+    """
+    with open(path, "rb") as f:
+        head = f.read(LP_GEOMETRY_SIZE * 2)
+        # super_empty.img starts with the geometry; a full super image reserves 4 KiB first
+        for geo_offset, meta_offset in ((0, LP_GEOMETRY_SIZE), (LP_GEOMETRY_SIZE, LP_GEOMETRY_SIZE * 3)):
+            geo = head[geo_offset:geo_offset + 52]
+            if len(geo) == 52 and struct.unpack("<I", geo[:4])[0] == LP_GEOMETRY_MAGIC:
+                break
+        else:
+            raise ValueError("No LP metadata geometry found.")
+        magic, geo_size, geo_checksum, metadata_max_size, slot_count, block_size = struct.unpack("<II32sIII", geo)
+        geo_raw = head[geo_offset:geo_offset + geo_size]
+        if hashlib.sha256(geo_raw[:8] + b"\0" * 32 + geo_raw[40:]).digest() != geo_checksum:
+            raise ValueError("LP geometry checksum mismatch.")
+        f.seek(meta_offset)
+        header = f.read(128)
+        if len(header) < 128:
+            raise ValueError("LP metadata header is truncated.")
+        magic, major, minor, header_size, _hdr_checksum, tables_size, tables_checksum = struct.unpack("<IHHI32sI32s", header[:80])
+        if magic != LP_HEADER_MAGIC:
+            raise ValueError("LP metadata header not found.")
+        descriptors = [struct.unpack("<III", header[80 + i * 12:92 + i * 12]) for i in range(4)]
+        f.seek(meta_offset + header_size)
+        tables = f.read(tables_size)
+    if len(tables) != tables_size or hashlib.sha256(tables).digest() != tables_checksum:
+        raise ValueError("LP metadata tables are truncated or corrupt.")
+    def entries(index: int, fmt: str) -> List[tuple]:
+        offset, count, entry_size = descriptors[index]
+        return [struct.unpack(fmt, tables[offset + i * entry_size:offset + i * entry_size + struct.calcsize(fmt)])
+                for i in range(count)]
+    extents = entries(1, "<QIQI")
+    groups = [{"name": _lp_name(n), "flags": fl, "max_size": mx} for n, fl, mx in entries(2, "<36sIQ")]
+    devices = [{"name": _lp_name(n), "first_sector": first, "size": size}
+               for first, _align, _align_off, size, n, _fl in entries(3, "<QIIQ36sI")]
+    partitions = []
+    for n, attrs, first_extent, num_extents, group_index in entries(0, "<36sIIII"):
+        sectors = sum(e[0] for e in extents[first_extent:first_extent + num_extents])
+        partitions.append({
+            "name": _lp_name(n),
+            "attributes": attrs,
+            "group": groups[group_index]["name"] if group_index < len(groups) else "?",
+            "size": sectors * LP_SECTOR_SIZE,
+        })
+    super_size = sum(d["size"] for d in devices)
+    reserved = devices[0]["first_sector"] * LP_SECTOR_SIZE if devices else 0
+    return {
+        "version": f"{major}.{minor}",
+        "block_size": block_size,
+        "slot_count": slot_count,
+        "metadata_max_size": metadata_max_size,
+        "super_size": super_size,
+        "usable_size": max(0, super_size - reserved),
+        "groups": groups,
+        "partitions": partitions,
+        "block_devices": devices,
+    }
+def describe_lp_metadata(metadata: Dict[str, Any]) -> str:
+    groups = ", ".join(f"{g['name']} (max {format_size(g['max_size']) if g['max_size'] else 'unlimited'})"
+                       for g in metadata["groups"] if g["name"] != "default")
+    names = ", ".join(p["name"] for p in metadata["partitions"])
+    return (f"Super size: {format_size(metadata['super_size'])}\n"
+            f"Groups: {groups or 'default'}\n"
+            f"Partitions: {names or 'none'}")
+def image_payload_size(path: str) -> int:
+    """Bytes an image occupies once written; sparse images are sized by their expanded length."""
+    with open(path, "rb") as f:
+        head = f.read(28)
+    if len(head) == 28:
+        magic, _major, _minor, _file_hdr, _chunk_hdr, blk_sz, total_blks = struct.unpack("<IHHHHII", head[:20])
+        if magic == SPARSE_HEADER_MAGIC:
+            return blk_sz * total_blks
+    return os.path.getsize(path)
+def read_fastboot_vars() -> Dict[str, str]:
+    """Run 'fastboot getvar all' once and return {name: value} (e.g. 'partition-size:system_a')."""
+    _code, out = run_subprocess("fastboot getvar all")
+    values: Dict[str, str] = {}
+    for line in out.splitlines():
+        line = line.strip()
+        if line.startswith("(bootloader)"):
+            line = line[len("(bootloader)"):].strip()
+        key, sep, value = line.rpartition(":")
+        if sep and key:
+            values[key.strip()] = value.strip()
+    return values
+def _device_size(device_vars: Dict[str, str], name: str) -> Optional[int]:
+    try:
+        return int(device_vars[f"partition-size:{name}"], 0)
+    except (KeyError, ValueError):
+        return None
+def plan_logical_flash(metadata: Dict[str, Any], device_vars: Dict[str, str], images: Dict[str, str],
+                       require_device_sizes: bool = False) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Map {base name: image path} onto the active slot's logical partitions and check group/super space.
+
+    Returns (rows, problems); partitions not being flashed are counted at their current device size.
+    Bootloader fastboot does not report logical sizes, so only a check against fastbootd's values
+    (require_device_sizes=True) is authoritative.
+    """
+    slot = device_vars.get("current-slot", "").lstrip("_")
+    suffix = f"_{slot}" if slot else ""
+    parts = {p["name"]: p for p in metadata["partitions"]}
+    rows = []
+    for base, path in sorted(images.items()):
+        name = base + suffix if base + suffix in parts else base
+        if name not in parts:
+            continue
+        rows.append({
+            "base": base, "name": name, "group": parts[name]["group"], "image": path,
+            "image_size": image_payload_size(path), "device_size": _device_size(device_vars, name),
+        })
+    flashing = {r["name"] for r in rows}
+    usage: Dict[str, int] = {}
+    for r in rows:
+        usage[r["group"]] = usage.get(r["group"], 0) + r["image_size"]
+    problems = []
+    other_slot = 0
+    for p in metadata["partitions"]:
+        if p["name"] in flashing:
+            continue
+        current = _device_size(device_vars, p["name"])
+        if suffix and not p["name"].endswith(suffix):
+            # the inactive slot still occupies super (dynamic A/B without virtual A/B)
+            other_slot += current if current is not None else p["size"]
+            continue
+        if current is None and require_device_sizes:
+            problems.append(f"Device did not report the size of {p['name']}.")
+        usage[p["group"]] = usage.get(p["group"], 0) + (current if current is not None else p["size"])
+    for g in metadata["groups"]:
+        used = usage.get(g["name"], 0)
+        if g["max_size"] and used > g["max_size"]:
+            problems.append(f"Group {g['name']} needs {format_size(used)} but allows {format_size(g['max_size'])}.")
+    total = sum(usage.values()) + other_slot
+    if metadata["usable_size"] and total > metadata["usable_size"]:
+        problems.append(f"Partitions need {format_size(total)} but super holds {format_size(metadata['usable_size'])}.")
+    return rows, problems
+def wait_for_fastboot(timeout: float = FASTBOOTD_WAIT_SECONDS) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        code, out = run_subprocess("fastboot devices")
+        if code == 0 and out.strip():
+            return True
+        time.sleep(2)
+    return False
+def is_fastbootd() -> bool:
+    _code, out = run_subprocess("fastboot getvar is-userspace")
+    return bool(re.search(r"is-userspace:\s*yes", out))
+def flash_logical_partitions(metadata: Dict[str, Any], rows: List[Dict[str, Any]]) -> None:
+    """Flash several logical partitions in one fastbootd session.
+
+    Space is re-checked against the sizes fastbootd reports before anything is written;
+    'fastboot flash' resizes each logical partition itself.
+    """
+    def worker():
+        started = time.monotonic_ns()
+        if not is_fastbootd():
+            append_console("[INFO] Rebooting to fastbootd...", "INFO")
+            run_subprocess("fastboot reboot fastboot")
+            time.sleep(2)
+            if not wait_for_fastboot() or not is_fastbootd():
+                append_console("[ERROR] Device did not return in fastbootd; nothing was changed.", "ERROR")
+                return
+        device_vars = read_fastboot_vars()
+        images = {r["base"]: r["image"] for r in rows}
+        checked, problems = plan_logical_flash(metadata, device_vars, images, require_device_sizes=True)
+        if len(checked) != len(rows):
+            problems.append("Some images no longer match a logical partition on the active slot.")
+        if problems:
+            for problem in problems:
+                append_console(f"[ERROR] {problem}", "ERROR")
+            append_console("[ERROR] Space check in fastbootd failed; nothing was changed on the device.", "ERROR")
+            return
+        for i, r in enumerate(checked, 1):
+            append_console(f"fastboot flash {r['name']} \"{r['image']}\"", "CMD")
+            set_status_progress(f"Logical flash {i}/{len(checked)}: {r['name']}")
+            step_started = time.monotonic_ns()
+            code = stream_command(["fastboot", "flash", r["name"], r["image"]],
+                                  lambda line: line.strip() and append_console(line.rstrip(), "INFO"))
+            append_console(f"Exit code: {code}", "INFO", exit_code=code, partition=r["name"],
+                           duration_ns=time.monotonic_ns() - step_started)
+            if code != 0:
+                append_console(f"[ERROR] Flashing {r['name']} failed (exit code {code}).", "ERROR")
+                return
+        set_status_progress("Logical flash done")
+        append_console(f"[SUCCESS] Flashed {len(checked)} logical partition(s).", "SUCCESS",
+                       duration_ns=time.monotonic_ns() - started)
+    threading.Thread(target=in_log_context(worker, cmd=new_command_id(), serial=LAST_DEVICE["serial"],
+                                           flash_session=FLASH_SESSION["id"]), daemon=True).start()
+
 # -------------------------
 # MODALS
 # -------------------------
 
+PICKER_VISIBLE_ROWS = 7
+PICKER_NAME_MAX = 44
+PICKER_SORT_KEYS = {
+    "Name": (lambda e: e["name"].lower(), False),
+    "Newest": (lambda e: e["mtime"], True),
+    "Largest": (lambda e: e["size"], True),
+}
+def build_catalog(paths: List[str]) -> List[Dict[str, Any]]:
+    """Stat each path once and return {path, name, mtime, size, is_dir} records."""
+    catalog = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            mtime, size = st.st_mtime, st.st_size
+        except OSError:
+            mtime, size = 0.0, 0
+        catalog.append({"path": p, "name": os.path.basename(p), "mtime": mtime, "size": size, "is_dir": os.path.isdir(p)})
+    return catalog
+def scan_dir_catalog(folder: str) -> List[Dict[str, Any]]:
+    """Return catalog records for the sub-folders of 'folder' using a single scandir pass."""
+    catalog = []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not entry.is_dir():
+                    continue
+                try:
+                    st = entry.stat()
+                    mtime, size = st.st_mtime, st.st_size
+                except OSError:
+                    mtime, size = 0.0, 0
+                catalog.append({"path": entry.path, "name": entry.name, "mtime": mtime, "size": size, "is_dir": True})
+    except OSError:
+        pass
+    return catalog
+def format_size(num_bytes: int) -> str:
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+def describe_entry(entry: Dict[str, Any]) -> str:
+    stamp = datetime.fromtimestamp(entry["mtime"]).strftime("%d-%m-%Y") if entry["mtime"] else "?"
+    return stamp if entry["is_dir"] else f"{format_size(entry['size'])}  {stamp}"
+def show_virtual_picker(title: str, heading: str, catalog: List[Dict[str, Any]], empty_text: str = "No entries found.") -> Optional[str]:
+    """Show a filterable, sortable picker that recycles a fixed pool of rows; return the chosen path."""
+    sel = ctk.CTkToplevel(app)
+    sel.title(title)
+    sel.geometry("560x440")
+    sel.grab_set()
+    sel.resizable(False, False)
+    container = ctk.CTkFrame(sel, corner_radius=12)
+    container.pack(fill="both", expand=True, padx=12, pady=12)
+    ctk.CTkLabel(container, text=heading, font=FONT_SUBTITLE).pack(pady=(6, 8))
+    tools = ctk.CTkFrame(container, fg_color="transparent")
+    tools.pack(fill="x", padx=4, pady=(0, 6))
+    tools.grid_columnconfigure(0, weight=1)
+    query = ctk.CTkEntry(tools, placeholder_text="Type to filter...", font=FONT_LABEL)
+    query.grid(row=0, column=0, sticky="ew", padx=(0, 8))
+    sort_var = ctk.StringVar(value="Name")
+    ctk.CTkOptionMenu(tools, values=list(PICKER_SORT_KEYS), variable=sort_var, width=110,
+                      command=lambda _v: apply_view(force=True)).grid(row=0, column=1)
+    body = ctk.CTkFrame(container, corner_radius=8)
+    body.pack(fill="both", expand=True, pady=(0, 6))
+    body.grid_columnconfigure(0, weight=1)
+    bar = ctk.CTkScrollbar(body, command=lambda *a: on_scrollbar(*a))
+    bar.grid(row=0, column=1, rowspan=PICKER_VISIBLE_ROWS, sticky="ns", padx=(0, 4), pady=4)
+    count_label = ctk.CTkLabel(container, text="", font=FONT_LABEL)
+    count_label.pack()
+    # sorted copies are built once per sort key; filtering only narrows them
+    sorted_cache: Dict[str, List[Dict[str, Any]]] = {}
+    state: Dict[str, Any] = {"view": [], "offset": 0, "query": None, "path": None}
+    def choose(idx: int):
+        pos = state["offset"] + idx
+        if pos < len(state["view"]):
+            state["path"] = state["view"][pos]["path"]
+            sel.destroy()
+    rows = []
+    for i in range(PICKER_VISIBLE_ROWS):
+        btn = create_button(body, "", lambda i=i: choose(i), variant="secondary")
+        btn.grid(row=i, column=0, sticky="ew", padx=(6, 0), pady=3)
+        meta = ctk.CTkLabel(body, text="", font=FONT_LABEL, width=150, anchor="e")
+        meta.grid(row=i, column=2, sticky="e", padx=(4, 8))
+        rows.append((btn, meta))
+    def render():
+        view = state["view"]
+        top = max(0, min(state["offset"], len(view) - PICKER_VISIBLE_ROWS))
+        state["offset"] = top
+        for i, (btn, meta) in enumerate(rows):
+            if top + i < len(view):
+                entry = view[top + i]
+                name = entry["name"]
+                if len(name) > PICKER_NAME_MAX:
+                    name = name[:PICKER_NAME_MAX - 1] + "…"
+                btn.configure(text=name, state="normal")
+                meta.configure(text=describe_entry(entry))
+            else:
+                btn.configure(text="", state="disabled")
+                meta.configure(text="")
+        if view:
+            bar.set(top / len(view), min(1.0, (top + PICKER_VISIBLE_ROWS) / len(view)))
+            count_label.configure(text=f"{len(view)} of {len(catalog)} shown")
+        else:
+            bar.set(0.0, 1.0)
+            count_label.configure(text=empty_text if not catalog else "No matches.")
+    def apply_view(force: bool = False):
+        needle = query.get().strip().lower()
+        if not force and needle == state["query"]:
+            return
+        state["query"] = needle
+        key_name = sort_var.get()
+        if key_name not in sorted_cache:
+            key, reverse = PICKER_SORT_KEYS.get(key_name, PICKER_SORT_KEYS["Name"])
+            sorted_cache[key_name] = sorted(catalog, key=key, reverse=reverse)
+        ordered = sorted_cache[key_name]
+        state["view"] = [e for e in ordered if needle in e["name"].lower()] if needle else ordered
+        state["offset"] = 0
+        render()
+    def scroll_by(step: int):
+        state["offset"] += step
+        render()
+    def on_scrollbar(*args):
+        if args and args[0] == "moveto":
+            state["offset"] = int(float(args[1]) * len(state["view"]))
+            render()
+        elif args and args[0] == "scroll":
+            scroll_by(int(args[1]) * (PICKER_VISIBLE_ROWS if args[2] == "pages" else 1))
+    def on_wheel(event):
+        up = getattr(event, "num", 0) == 4 or getattr(event, "delta", 0) > 0
+        scroll_by(-1 if up else 1)
+    for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+        sel.bind(seq, on_wheel)
+    sel.bind("<Up>", lambda _e: scroll_by(-1))
+    sel.bind("<Down>", lambda _e: scroll_by(1))
+    sel.bind("<Prior>", lambda _e: scroll_by(-PICKER_VISIBLE_ROWS))
+    sel.bind("<Next>", lambda _e: scroll_by(PICKER_VISIBLE_ROWS))
+    sel.bind("<Return>", lambda _e: choose(0))
+    sel.bind("<Escape>", lambda _e: sel.destroy())
+    query.bind("<KeyRelease>", lambda _e: apply_view())
+    bottom = ctk.CTkFrame(container, fg_color="transparent")
+    bottom.pack()
+    create_button(bottom, "Cancel", lambda: sel.destroy(), variant="danger", width=120).pack(pady=4)
+    apply_view(force=True)
+    sel.after(100, query.focus_set)
+    sel.wait_window()
+    return state["path"]
 def show_device_folder_modal() -> Optional[str]:
     """Show device selection modal and return selected device folder path."""
     if not os.path.isdir(MAIN_DIR):
         show_dialog("error", "Missing Folder", f"Main folder not found:\n{MAIN_DIR or '(not set)'}")
         return None
-    win = ctk.CTkToplevel(app)
-    win.title("Select Device")
-    win.geometry("420x360")
-    win.grab_set()
-    win.resizable(False, False)
-    container = ctk.CTkFrame(win, corner_radius=12)
-    container.pack(fill="both", expand=True, padx=12, pady=12)
-    ctk.CTkLabel(container, text="Choose a Device Folder", font=FONT_SUBTITLE).pack(pady=(8, 6))
-    list_frame = ctk.CTkScrollableFrame(container, corner_radius=10, width=360, height=200)
-    list_frame.pack(fill="both", expand=True, padx=10, pady=6)
-    selected: Dict[str, str] = {"path": None}
-    def on_select(path: str):
-        selected["path"] = path
-        win.destroy()
-    items = [d for d in os.listdir(MAIN_DIR) if os.path.isdir(os.path.join(MAIN_DIR, d))]
-    if not items:
-        ctk.CTkLabel(list_frame, text="No device folders found.", font=FONT_LABEL).pack(pady=20)
-    else:
-        for d in items:
-            full_path = os.path.join(MAIN_DIR, d)
-            btn = create_button(list_frame, text=d, command=lambda p=full_path: on_select(p), variant="primary")
-            btn.pack(fill="x", padx=6, pady=4)
-    action_frame = ctk.CTkFrame(container, fg_color="transparent")
-    action_frame.pack(fill="x", pady=(10, 6))
-    create_button(action_frame, "Cancel", lambda: win.destroy(), variant="secondary").pack(side="right", padx=8)
-    win.wait_window()
-    return selected["path"]
+    return show_virtual_picker("Select Device", "Choose a Device Folder", scan_dir_catalog(MAIN_DIR),
+                               empty_text="No device folders found.")
 
 # -------------------------
 # COMMAND RUNNER
@@ -518,33 +1383,68 @@ def show_directory_picker_modal(title: str = "Select Folder") -> Optional[str]:
     )
     return directory if directory else None
 def show_file_selection_modal(paths: List[str], title: str = "Select a file") -> Optional[str]:
+    return show_virtual_picker("Select File", title, build_catalog(paths), empty_text="No files found.")
+
+def show_logical_partition_modal(metadata: Dict[str, Any], device_vars: Dict[str, str],
+                                 images: Dict[str, str]) -> Optional[List[Dict[str, Any]]]:
+    """Show the super partition table and let the user pick images to flash; return the planned rows."""
     sel = ctk.CTkToplevel(app)
-    sel.title("Select File")
-    sel.geometry("520x360")
+    sel.title("Logical Partitions")
+    sel.geometry("720x520")
     sel.grab_set()
-    sel.resizable(False, False)
     container = ctk.CTkFrame(sel, corner_radius=12)
-    container.pack(fill="both", expand=True, padx=12, pady=12)
-    ctk.CTkLabel(container, text=title, font=FONT_SUBTITLE).pack(pady=(6, 10))
-    scroll = ctk.CTkScrollableFrame(container, corner_radius=8, width=480, height=230)
-    scroll.pack(fill="both", expand=True, pady=(0, 10))
-    choice = {"path": None}
-    def choose(p: str):
-        choice["path"] = p
+    container.pack(fill="both", expand=True, padx=10, pady=10)
+    ctk.CTkLabel(container, text="Super Partition Table", font=FONT_SUBTITLE).pack(pady=(8, 6))
+    lines = [f"{'Partition':<24}{'Group':<30}{'Device size':>14}", "-" * 68]
+    for p in metadata["partitions"]:
+        dev = _device_size(device_vars, p["name"])
+        lines.append(f"{p['name']:<24}{p['group']:<30}{format_size(dev) if dev is not None else '?':>14}")
+    lines += ["", describe_lp_metadata(metadata), f"Active slot: {device_vars.get('current-slot') or 'n/a'}",
+              "Sizes are re-read and space re-checked in fastbootd before anything is flashed."]
+    table = ctk.CTkTextbox(container, wrap="none", font=FONT_CODE, height=170, corner_radius=8)
+    table.pack(fill="x", padx=10, pady=(0, 8))
+    table.insert("1.0", "\n".join(lines))
+    table.configure(state="disabled")
+    checks_frame = ctk.CTkScrollableFrame(container, corner_radius=8, height=140)
+    checks_frame.pack(fill="both", expand=True, padx=10, pady=(0, 6))
+    all_rows, _ = plan_logical_flash(metadata, device_vars, images)
+    check_vars = []
+    for r in all_rows:
+        var = ctk.BooleanVar(value=True)
+        label = f"{r['name']}  ←  {os.path.basename(r['image'])}  ({format_size(r['image_size'])})"
+        ctk.CTkCheckBox(checks_frame, text=label, variable=var, font=FONT_LABEL,
+                        command=lambda: refresh()).pack(anchor="w", padx=8, pady=3)
+        check_vars.append((var, r))
+    if not all_rows:
+        ctk.CTkLabel(checks_frame, text="No images match a logical partition.", font=FONT_LABEL).pack(pady=16)
+    problems_label = ctk.CTkLabel(container, text="", font=FONT_LABEL, text_color=PALETTE["danger"],
+                                  wraplength=660, justify="left")
+    problems_label.pack(fill="x", padx=10)
+    result: Dict[str, Any] = {"rows": None}
+    def selected_images() -> Dict[str, str]:
+        return {r["base"]: r["image"] for var, r in check_vars if var.get()}
+    def refresh():
+        rows, problems = plan_logical_flash(metadata, device_vars, selected_images())
+        problems_label.configure(text="\n".join(problems))
+        flash_btn.configure(state="normal" if rows and not problems else "disabled")
+    def on_flash():
+        result["rows"], _ = plan_logical_flash(metadata, device_vars, selected_images())
         sel.destroy()
-    for p in sorted(paths):
-        create_button(scroll, text=os.path.basename(p), command=lambda pp=p: choose(pp),
-                      variant="secondary", width=460).pack(pady=4, padx=4)
-    bottom = ctk.CTkFrame(container, fg_color="transparent")
-    bottom.pack()
-    create_button(bottom, "Cancel", lambda: sel.destroy(), variant="danger", width=120).pack(pady=4)
+    btn_frame = ctk.CTkFrame(container, fg_color="transparent")
+    btn_frame.pack(fill="x", pady=8)
+    flash_btn = create_button(btn_frame, "Flash Selected", on_flash, variant="success", width=140)
+    flash_btn.pack(side="left", padx=12)
+    create_button(btn_frame, "Cancel", lambda: sel.destroy(), variant="danger").pack(side="right", padx=12)
+    refresh()
     sel.wait_window()
-    return choice["path"]
+    return result["rows"]
 
 # -------------------------
 # ACTIONS
 # -------------------------
 
+def set_status_progress(text: str):
+    app.after(0, lambda: status_progress.configure(text=text))
 def update_status_bar(last_action: str = ""):
     mode, serial = get_device_state()
     status_label.configure(text=f"Device: {serial or 'None'}    |    Mode: {mode}")
@@ -582,6 +1482,7 @@ def action_flash_generic(folder_type, fastboot_partition):
         append_console(f"[INFO] {fastboot_partition} flash cancelled by user.", "INFO")
         return
 
+    mark_flash_session(f"flash {fastboot_partition}: {os.path.basename(selected_file)}")
     run_command_thread(f'fastboot flash {fastboot_partition} "{selected_file}"')
     update_status_bar()
 def action_flash_recovery(): action_flash_generic("recovery","recovery")
@@ -600,12 +1501,58 @@ def action_flash_super():
     if not os.path.isfile(super_file):
         show_dialog("error", "Missing File", "super_empty.img not found")
         return
-    if not show_dialog("confirm", "Confirm Super Flash", f"Flash super_empty.img to device?\n\nThis will wipe the super partition.\n\nFile: {os.path.basename(super_file)}"):
+    try:
+        metadata = parse_lp_metadata(super_file)
+    except (ValueError, OSError, struct.error) as e:
+        show_dialog("error", "Invalid super_empty.img", str(e))
+        return
+    append_console(f"[INFO] super_empty.img: {describe_lp_metadata(metadata)}", "INFO")
+    if not show_dialog("confirm", "Confirm Super Flash", f"Flash super_empty.img to device?\n\nThis will wipe the super partition.\n\n{describe_lp_metadata(metadata)}"):
         append_console("[INFO] Super flash cancelled by user.", "INFO")
         return
 
+    mark_flash_session("flash super_empty.img")
     run_command_thread(f'fastboot flash super "{super_file}"')
     update_status_bar()
+def action_flash_logical():
+    append_console("[ACTION] Flash logical partitions", "INFO")
+    mode, _ = get_device_state()
+    if mode != "FASTBOOT":
+        show_dialog("error", "Wrong Mode", "Device must be in FASTBOOT mode")
+        return
+    recovery_dir = find_recovery_path(selected_device_folder)
+    if not recovery_dir:
+        show_dialog("error", "Missing Folder", "No recovery folder found")
+        return
+    super_file = os.path.join(recovery_dir,"super_empty.img")
+    if not os.path.isfile(super_file):
+        show_dialog("error", "Missing File", "super_empty.img not found")
+        return
+    try:
+        metadata = parse_lp_metadata(super_file)
+    except (ValueError, OSError, struct.error) as e:
+        show_dialog("error", "Invalid super_empty.img", str(e))
+        return
+    images = {os.path.splitext(f)[0]: os.path.join(recovery_dir, f) for f in os.listdir(recovery_dir)
+              if f.lower().endswith(".img") and f.lower() != "super_empty.img"}
+    append_console("[INFO] Reading partition sizes from device...", "INFO")
+    def fetch_vars():
+        # 'getvar all' can take seconds; keep it off the Tk thread and return there for the modal
+        device_vars = read_fastboot_vars()
+        app.after(0, _choose_and_flash_logical, metadata, images, device_vars)
+    threading.Thread(target=fetch_vars, daemon=True).start()
+def _choose_and_flash_logical(metadata: Dict[str, Any], images: Dict[str, str], device_vars: Dict[str, str]):
+    rows = show_logical_partition_modal(metadata, device_vars, images)
+    if not rows:
+        append_console("[INFO] Logical partition flash cancelled.", "INFO")
+        return
+    names = ", ".join(r["name"] for r in rows)
+    if not show_dialog("confirm", "Confirm Logical Flash", f"Flash these logical partitions in fastbootd?\n\n{names}"):
+        append_console("[INFO] Logical partition flash cancelled by user.", "INFO")
+        return
+    mark_flash_session(f"flash logical: {names}")
+    flash_logical_partitions(metadata, rows)
+    update_status_bar()
 def action_adb_sideload():
     append_console("[ACTION] ADB Sideload", "INFO")
     mode, _ = get_device_state()
@@ -630,41 +1577,52 @@ def action_adb_sideload():
 
     append_console(f"[INFO] Starting sideload: {selected_file}")
     def run_sideload():
-        process = subprocess.Popen(["adb","sideload",selected_file], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        last_percent = None
-        printed_progress = False
-        for line in iter(process.stdout.readline,''):
+        started = time.monotonic_ns()
+        append_console("[INFO] Verifying ZIP integrity...", "INFO")
+        ok, message = verify_zip(selected_file, lambda percent: set_status_progress(f"Verify:{percent}%"))
+        if not ok:
+            set_status_progress("Verify failed")
+            append_console(f"[ERROR] ZIP verification failed: {message}", "ERROR")
+            return
+        append_console(f"[SUCCESS] ZIP verified: {message}", "SUCCESS")
+        mark_flash_session(f"sideload: {os.path.basename(selected_file)}")
+        progress = {"last_percent": None, "printed": False, "line": ""}
+        def on_line(line: str):
             line = line.rstrip()
             if not line:
-                continue
+                return
+            progress["line"] = line
             match = re.search(r"\(~(\d+)%\)", line)
             if match:
                 percent = match.group(1)
-                if last_percent is None:
+                if progress["last_percent"] is None:
                     append_console(line, "INFO")
-                    printed_progress = True
-                elif percent != last_percent:
+                    progress["printed"] = True
+                elif percent != progress["last_percent"]:
                     replace_last_console_line(line, "INFO")
-                last_percent = percent
+                progress["last_percent"] = percent
                 update_status_bar(f"Sideload:{percent}%")
             else:
                 append_console(line,"INFO")
-        process.wait()
-        if printed_progress:
-            final_text = line if 'line' in locals() and line else ("sideload complete" if process.returncode==0 else "sideload failed")
-            replace_last_console_line(final_text, "SUCCESS" if process.returncode==0 else "ERROR")
-        append_console("[SUCCESS] Sideload completed" if process.returncode==0 else "[ERROR] Sideload failed",
-                       "SUCCESS" if process.returncode==0 else "ERROR")
-    threading.Thread(target=run_sideload, daemon=True).start()
+        code = stream_command(["adb","sideload",selected_file], on_line)
+        if progress["printed"]:
+            final_text = progress["line"] or ("sideload complete" if code==0 else "sideload failed")
+            replace_last_console_line(final_text, "SUCCESS" if code==0 else "ERROR")
+        append_console("[SUCCESS] Sideload completed" if code==0 else "[ERROR] Sideload failed",
+                       "SUCCESS" if code==0 else "ERROR", exit_code=code, duration_ns=time.monotonic_ns() - started)
+    threading.Thread(target=in_log_context(run_sideload, cmd=new_command_id(), serial=LAST_DEVICE["serial"]),
+                     daemon=True).start()
 def action_reboot(target):
     append_console(f"[ACTION] Reboot to {target}", "INFO")
-    mode, _ = get_device_state()
+    mode, serial = get_device_state()
+    issued = True
     if target=="system":
         if mode=="FASTBOOT":
             run_command_thread("fastboot reboot", False)
         elif mode in ("ADB","SIDELOAD"):
             run_command_thread("adb reboot", False)
         else:
+            issued = False
             show_dialog("error","No Device","No device found to reboot.")
     elif target=="recovery":
         if mode=="FASTBOOT":
@@ -672,7 +1630,11 @@ def action_reboot(target):
         elif mode in ("ADB","SIDELOAD"):
             run_command_thread("adb reboot recovery", False)
         else:
+            issued = False
             show_dialog("error","No Device","No device found to reboot.")
+    if issued and serial and FLASH_SESSION["id"]:
+        if start_device_capture(serial, "logcat" if target=="system" else "dmesg", FLASH_SESSION["id"]):
+            FLASH_SESSION.update(id=None, label=None)
     update_status_bar()
 def action_custom_command():
     append_console("[ACTION] Custom Command", "INFO")
@@ -681,6 +1643,9 @@ def action_custom_command():
         run_command_thread(cmd)
     else:
         append_console("[INFO] Custom command cancelled.", "INFO")
+def action_exit():
+    stop_all_captures()
+    app.destroy()
 def action_change_device():
     global selected_device_folder
     append_console("[ACTION] Change Device", "INFO")
@@ -727,8 +1692,8 @@ ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 app = ctk.CTk()
 app.title("Custom ROM Flashing Tool")
-app.geometry("1200x600")
-app.protocol("WM_DELETE_WINDOW", app.destroy)
+app.geometry("1200x650")
+app.protocol("WM_DELETE_WINDOW", action_exit)
 app.grid_rowconfigure(0, weight=0)
 app.grid_rowconfigure(1, weight=5)  # Give console even more space
 app.grid_columnconfigure(1, weight=1)
@@ -741,6 +1706,7 @@ buttons = [
     ("Flash Recovery", action_flash_recovery, "primary"),
     ("Flash Boot", action_flash_boot, "primary"),
     ("Flash super_empty", action_flash_super, "primary"),
+    ("Logical Partitions", action_flash_logical, "primary"),
     ("ADB Sideload (ROM ZIP)", action_adb_sideload, "primary"),
     ("View Logs", open_logs_modal, "secondary"),
     ("Change Main Folder", action_change_main_dir, "secondary"),
@@ -749,7 +1715,7 @@ buttons = [
     ("Custom Command", action_custom_command, "secondary"),
     ("Check Device", action_check_device, "secondary"),
     ("Change Device", action_change_device, "secondary"),
-    ("Exit", app.destroy, "danger")
+    ("Exit", action_exit, "danger")
 ]
 for text, cmd, variant in buttons:
     btn = create_button(sidebar, text=text, command=cmd, variant=variant, width=190)
@@ -801,6 +1767,13 @@ status_progress.pack(side="left", padx=10)
 
 def start_app():
     global selected_device_folder
+    try:
+        set_transport(TRANSPORT_MODE, TRANSPORT_TRANSCRIPT or None, parse_replay_speed(TRANSPORT_REPLAY_SPEED))
+    except Exception as e:
+        show_dialog("error", "Command Transport", f"{e}\n\nFalling back to live mode.")
+        set_transport("live")
+    if TRANSPORT["mode"] != "live":
+        append_console(f"[INFO] Command transport: {TRANSPORT['mode']} ({TRANSPORT['path']})", "WARNING")
     if not ensure_main_dir():
         append_console("[ERROR] No main folder selected. Exiting.", "ERROR")
         show_dialog("info","Exit","No main folder selected. Exiting application.")